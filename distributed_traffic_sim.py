@@ -21,20 +21,27 @@ import json
 import random
 import os
 import sys
-import statistics
-from datetime import datetime
 import collections
+import concurrent.futures
 import queue
+import base64
+import hashlib
+import zlib
+import multiprocessing
+from multiprocessing import shared_memory
 
 # For finding a unique port for each worker's Flask app
 import socket
 
 try:
-    from flask import Flask, request, jsonify, render_template_string, Response
+    from flask import Flask, request, jsonify, Response
+    from werkzeug.wsgi import ClosingIterator
     import requests
+    from requests.adapters import HTTPAdapter
+    import numpy as np
 except ImportError:
-    print("Error: Flask and/or requests library not found.")
-    print("Please install them using: pip install Flask requests")
+    print("Error: Flask, requests and/or numpy library not found.")
+    print("Please install them using: pip install Flask requests numpy")
     sys.exit(1)
 
 # Import the network latency simulator if available
@@ -47,37 +54,181 @@ except ImportError:
     class DummyNetworkSimulator:
         def __init__(self, *args, **kwargs): pass
         def simulate_delay(self): pass
+        def sample_delay(self): return 0.0 # Seconds of simulated latency for one message
         def network_call(self, func): return func
     net_sim = DummyNetworkSimulator()
 
+# Serve with waitress (bounded thread pool) if available, else fall back to Flask's dev server
+try:
+    from waitress import serve as waitress_serve
+except ImportError:
+    waitress_serve = None
+
+# Fan step commands out with asyncio + aiohttp if available, else a thread pool
+try:
+    import asyncio
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Use orjson for the hot JSON payloads if available (serializes NumPy arrays natively)
+try:
+    import orjson
+    def json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    def json_dumps(obj):
+        return json.dumps(obj, default=lambda o: o.tolist()).encode('utf-8')
+    json_loads = json.loads
+
+# Workers post their updates as msgpack (binary, no repeated key text) when both ends have it installed:
+# the master lists the encodings it accepts in its /register_worker reply, JSON is always among them.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+JSON_HEADERS = {'Content-Type': 'application/json'} # For bodies pre-serialized with json_dumps
+UPDATE_FORMATS = ['json', 'msgpack'] if msgpack is not None else ['json'] # Accepted by this master
+use_msgpack_updates = False # Worker side: set at registration if the master accepts msgpack
+
+def encode_update(obj):
+    """Serialize a worker->master update; returns (body, content_type)."""
+    if use_msgpack_updates:
+        return msgpack.packb(obj, use_single_float=True), MSGPACK_CONTENT_TYPE
+    return json_dumps(obj), 'application/json'
+
+def decode_update(req):
+    """Parse an update request body according to its Content-Type; None if this master cannot read it."""
+    if req.mimetype == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            return None
+        return msgpack.unpackb(req.get_data(), raw=False)
+    return json_loads(req.get_data()) # Hot path: orjson when available instead of Flask's stdlib json
+
 
 # =============================================================================
 # Global Configuration and Data Structures
 # =============================================================================
 app = Flask(__name__)
 
+# Route Flask's own JSON (jsonify replies, request.json) through orjson too (Flask >= 2.2)
+if orjson is not None:
+    try:
+        from flask.json.provider import DefaultJSONProvider
+
+        class OrjsonProvider(DefaultJSONProvider):
+            def dumps(self, obj, **kwargs):
+                return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+
+            def loads(self, s, **kwargs):
+                return orjson.loads(s)
+
+        app.json = OrjsonProvider(app)
+    except ImportError:
+        pass # Older Flask: replies keep the stdlib encoder; hot request bodies still use json_loads
+
+# One pooled HTTP session for every master<->worker call, so TCP connections are kept alive
+# between steps instead of being opened and torn down per request.
+http_session = requests.Session()
+http_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
+http_session.headers['Connection'] = 'keep-alive'
+
+# Fans each step out to all workers at once (one thread per zone) when aiohttp is not installed
+step_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='step')
+
+# Request threads per server. Under waitress every open dashboard SSE stream holds one of these for as
+# long as it is connected, so streams are capped at MAX_SSE_SUBSCRIBERS and the rest of the pool stays
+# free for worker updates, registrations and page loads. Raise both together for more viewers.
+# (Flask's dev server starts a thread per request, so there is no pool to protect and no cap.)
+SERVER_THREADS = 8
+MAX_SSE_SUBSCRIBERS = SERVER_THREADS // 2 # Further /stream_data requests get 503 until a viewer leaves
+
+def run_server(port, threads=SERVER_THREADS, sock=None):
+    """Serve the Flask app on a fixed-size thread pool instead of one new thread per request."""
+    if waitress_serve is not None:
+        if sock is not None: # Already bound and listening on `port`: serve on it, never release and re-bind
+            waitress_serve(app, sockets=[sock], threads=threads, connection_limit=100)
+        else:
+            waitress_serve(app, host='0.0.0.0', port=port, threads=threads, connection_limit=100)
+    else:
+        print("Warning: waitress not installed (pip install waitress); using Flask's dev server with a thread per request.")
+        if sock is not None:
+            sock.close() # The dev server binds by port number itself
+        app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
+
 # Master Node Data
 registered_workers = {} # {zone: {'url': 'http://host:port', 'last_seen': timestamp, 'car_count': 0, 'current_zone_data': {}}}
-total_cars_in_sim = 0
+# registered_workers and full_simulation_grid_data are copy-on-write: writers build new dicts under this
+# lock and rebind the globals, so readers just grab the current reference once and use it without locking.
+registered_workers_write_lock = threading.Lock()
+total_cars = 0 # Sum of the workers' car counts, adjusted by each writer's delta under the lock; readers just load it
 simulation_step = 0
 simulation_active = True
 simulation_start_time = 0
 step_start_time = 0
-step_times = []
+STEP_TIMES_WINDOW = 1000 # The reported average covers the most recent steps only, so memory stays constant
+step_times = collections.deque(maxlen=STEP_TIMES_WINDOW)
+step_time_sum = 0.0 # Running sum of step_times, so the average is O(1)
 
 # Data structures for real-time graphing (for aggregate total cars)
+# Appended to only under registered_workers_write_lock, and deque.append / list(deque) are atomic
+# under the GIL, so readers take a list() snapshot without a lock.
 graph_data_history = collections.deque(maxlen=100) # Keep last 100 data points
-graph_data_lock = threading.Lock() # To protect access to graph_data_history
+# Updates arrive after a step's ack, so step N is charted once every live zone has reported it
+charted_step = 0
+STALE_WORKER_SECONDS = 5 # A zone silent for this long no longer holds the chart back
 
 # Global state for the entire simulation grid data for live visualization
-full_simulation_grid_data = {} # {zone_name: {'vehicles': [], 'traffic_light': {}}}
-full_simulation_grid_data_lock = threading.Lock() # To protect concurrent access
+# Copy-on-write like registered_workers (same writer lock), so the SSE publisher reads it without locking
+full_simulation_grid_data = {} # {zone_name: {'vehicles_b64': str, 'traffic_light': {}}}
+
+# SSE streams block on this condition until the master publishes a new step (no polling)
+state_cv = threading.Condition()
+state_version = 0 # Bumped on every published change
+# Latest published state: (keyframe frame, delta frame). Both are serialized once and shared by
+# every SSE stream; a stream that missed a version gets the keyframe instead.
+latest_sse_frame = (None, None)
+# What the last published frame contained, so the next one only carries changes (emitter thread only)
+published_zone_data = {} # {zone: {'vehicles_b64', 'traffic_light'}} as last sent
+published_workers = {} # {zone: worker details} as last sent
+published_history_step = 0 # Newest chart point already sent
+SSE_KEEPALIVE_SECONDS = 15 # Idle streams send a comment line this often to keep the connection open
+# The simulation only flags changes; sse_emitter_loop publishes at most once per interval,
+# so SSE bandwidth and serialization cost stay fixed however fast the simulation ticks.
+SSE_EMIT_INTERVAL = 0.2 # Seconds (5 Hz is plenty for the dashboard)
+state_dirty = threading.Event()
+sse_subscribers = 0 # Open /stream_data connections (guarded by state_cv); with none, nothing is serialized
 
 # Worker Node Data
 worker_zone = None
 master_host = None
 master_port = 5000
 worker_id = f"worker_{os.getpid()}"
+# worker_id is fixed for the process, so the /simulate_step acknowledgement is serialized once
+SIMSTEP_ACK_BODY = json_dumps({"status": "acknowledged", "worker_id": worker_id})
+update_batch_ticks = 1 # Simulation steps buffered into one worker->master update (--batch-ticks)
+pending_updates = collections.deque() # (step, car_count) for steps not yet reported to the master
+# A step the master sends again (e.g. a retry after a timeout) is acknowledged without re-simulating it;
+# the lock serializes /simulate_step so a duplicate arriving concurrently sees the first one's result.
+worker_step_lock = threading.Lock()
+last_simulated_step = None
+
+# Outgoing updates wait here until their simulated network latency has elapsed, so the
+# delay is applied in the background instead of blocking the request that produced them.
+# Bounded: if the master stalls, the oldest batches are dropped (newer snapshots supersede them anyway).
+MAX_OUTBOUND_BATCHES = 32
+outbound_queue = collections.deque(maxlen=MAX_OUTBOUND_BATCHES) # (due_time, batch), due times non-decreasing
+outbound_cv = threading.Condition()
+last_outbound_due = 0.0
+# The sender waits this long for more updates to share a POST (--batch-window-ms). Off by default: at the
+# default step rate there is only ever one update in flight, so waiting would only add latency.
+batch_window_ms = 0
+MAX_BATCH_UPDATES = 16 # ...but never coalesces past this many steps in one POST (a single --batch-ticks batch is not split)
+last_sent_traffic_light = None # Light state the master last acknowledged; unchanged lights are not re-sent (sender thread only)
 
 # Worker-specific simulation parameters and vehicle/traffic light models
 ZONE_SIZE = 200 # Pixels for a square zone in the visualization
@@ -86,56 +237,169 @@ CAR_SIZE = 5 # Pixels (square car)
 CAR_SPEED = 7 # Increased car speed for faster movement (WAS 5)
 MAX_CARS_PER_ZONE = 80 # Increased maximum cars per zone (WAS 40)
 
-class Vehicle:
-    def __init__(self, x, y, direction, zone_bounds, id):
-        self.x = x
-        self.y = y
-        self.direction = direction # 'N', 'S', 'E', 'W'
-        self.zone_bounds = zone_bounds # (min_x, min_y, max_x, max_y)
-        self.id = id
-
-    def move(self):
-        min_x, min_y, max_x, max_y = self.zone_bounds
-        if self.direction == 'E':
-            self.x += CAR_SPEED
-            if self.x > max_x + CAR_SIZE: self.x = min_x - CAR_SIZE # Wrap around, slightly off-screen to disappear
-        elif self.direction == 'W':
-            self.x -= CAR_SPEED
-            if self.x < min_x - CAR_SIZE: self.x = max_x + CAR_SIZE # Wrap around
-        elif self.direction == 'S':
-            self.y += CAR_SPEED
-            if self.y > max_y + CAR_SIZE: self.y = min_y - CAR_SIZE # Wrap around
-        elif self.direction == 'N':
-            self.y -= CAR_SPEED
-            if self.y < min_y - CAR_SIZE: self.y = max_y + CAR_SIZE # Wrap around
-
-    def get_state(self):
-        return {'id': self.id, 'x': self.x, 'y': self.y, 'direction': self.direction}
+# Every zone is simulated in its own local (0, 0, ZONE_SIZE, ZONE_SIZE) frame, so the wrap
+# lines are module constants: a car past one edge (slightly off-screen) reappears at the other.
+WRAP_LOW = -float(CAR_SIZE)
+WRAP_HIGH = float(ZONE_SIZE + CAR_SIZE)
+
+# Direction codes used by the vehicle arrays: 0=E, 1=W, 2=S, 3=N
+DIRECTIONS = ('E', 'W', 'S', 'N')
+DIRECTION_CODES = {d: i for i, d in enumerate(DIRECTIONS)}
+# Per-tick movement per direction code, pre-scaled by CAR_SPEED so a move is a single lookup + add
+DX_TABLE = np.array([CAR_SPEED, -CAR_SPEED, 0, 0], dtype=np.float32)
+DY_TABLE = np.array([0, 0, CAR_SPEED, -CAR_SPEED], dtype=np.float32)
+DIRECTION_BYTES = np.frombuffer(''.join(DIRECTIONS).encode('ascii'), dtype=np.uint8) # Code -> ASCII letter
+# Spawn points per direction, slightly outside the edge to make full "enter" visible
+SPAWN_XY = {
+    'E': (-CAR_SIZE, ZONE_SIZE/2 - CAR_SIZE/2),
+    'W': (ZONE_SIZE, ZONE_SIZE/2 - CAR_SIZE/2),
+    'S': (ZONE_SIZE/2 - CAR_SIZE/2, -CAR_SIZE),
+    'N': (ZONE_SIZE/2 - CAR_SIZE/2, ZONE_SIZE)
+}
+
+# Batched RNG for spawn directions: one NumPy call fills RNG_BUFFER_SIZE values,
+# kept as a Python list so each draw is a list pop instead of random.choice().
+RNG_BUFFER_SIZE = 8192
+rng = np.random.default_rng()
+direction_buffer = []
+
+def reset_rng():
+    """Start a fresh generator (e.g. in a forked zone process, which would otherwise replay the parent's)."""
+    global rng
+    rng = np.random.default_rng()
+    direction_buffer.clear()
+
+def next_direction():
+    """Next random direction letter from the batched buffer."""
+    if not direction_buffer:
+        direction_buffer.extend(DIRECTIONS[code] for code in rng.integers(0, len(DIRECTIONS), size=RNG_BUFFER_SIZE).tolist())
+    return direction_buffer.pop()
+
+# JIT-compile the per-tick vehicle update with numba if available; otherwise ZoneState.step uses NumPy
+try:
+    from numba import njit
+
+    @njit(cache=True, fastmath=True)
+    def step_zone(xs, ys, dirs, n, low, high):
+        """Move and wrap the first n cars in place (single fused loop, no temporaries)."""
+        for i in range(n):
+            x = xs[i] + DX_TABLE[dirs[i]]
+            y = ys[i] + DY_TABLE[dirs[i]]
+            if x > high: x = low
+            elif x < low: x = high
+            if y > high: y = low
+            elif y < low: y = high
+            xs[i] = x
+            ys[i] = y
+except ImportError:
+    step_zone = None
+
+class ZoneState:
+    """Vehicles of a zone stored as parallel NumPy arrays (struct-of-arrays)."""
+    __slots__ = ('xs', 'ys', 'dirs', 'count')
+
+    def __init__(self, capacity=MAX_CARS_PER_ZONE, buffer=None):
+        if buffer is None:
+            self.xs = np.zeros(capacity, dtype=np.float32)
+            self.ys = np.zeros(capacity, dtype=np.float32)
+            self.dirs = np.zeros(capacity, dtype=np.int8)
+        else:
+            # Arrays live in a caller-provided buffer (e.g. shared memory), laid out xs | ys | dirs
+            self.xs = np.ndarray(capacity, dtype=np.float32, buffer=buffer, offset=0)
+            self.ys = np.ndarray(capacity, dtype=np.float32, buffer=buffer, offset=4 * capacity)
+            self.dirs = np.ndarray(capacity, dtype=np.int8, buffer=buffer, offset=8 * capacity)
+        self.count = 0 # Only the first `count` slots of each array hold live cars
+
+    @staticmethod
+    def buffer_size(capacity=MAX_CARS_PER_ZONE):
+        """Bytes needed for an external buffer holding `capacity` cars."""
+        return 9 * capacity
+
+    def __len__(self):
+        return self.count
+
+    def add(self, x, y, direction):
+        i = self.count
+        self.xs[i] = x
+        self.ys[i] = y
+        self.dirs[i] = DIRECTION_CODES[direction]
+        self.count += 1
+
+    def extend(self, xs, ys, dirs):
+        """Append a batch of cars given as arrays (dirs as direction codes)."""
+        i, j = self.count, self.count + len(xs)
+        self.xs[i:j] = xs
+        self.ys[i:j] = ys
+        self.dirs[i:j] = dirs
+        self.count = j
+
+    def remove(self, index):
+        """O(1) swap-and-pop: the last car takes the removed car's slot (car order is not meaningful)."""
+        last = self.count - 1
+        self.xs[index] = self.xs[last]
+        self.ys[index] = self.ys[last]
+        self.dirs[index] = self.dirs[last]
+        self.count = last
+
+    def step(self):
+        """Move every car one tick and wrap the ones that left the zone."""
+        n = self.count
+        if step_zone is not None:
+            step_zone(self.xs, self.ys, self.dirs, n, WRAP_LOW, WRAP_HIGH)
+            return
+        xs, ys, dirs = self.xs[:n], self.ys[:n], self.dirs[:n]
+        xs += DX_TABLE[dirs]
+        ys += DY_TABLE[dirs]
+        # Wrap around, slightly off-screen to disappear
+        xs[:] = np.where(xs > WRAP_HIGH, WRAP_LOW, xs)
+        xs[:] = np.where(xs < WRAP_LOW, WRAP_HIGH, xs)
+        ys[:] = np.where(ys > WRAP_HIGH, WRAP_LOW, ys)
+        ys[:] = np.where(ys < WRAP_LOW, WRAP_HIGH, ys)
+
+    def warm_up(self):
+        """Compile the numba kernel (if any) before the first timed step."""
+        if step_zone is not None:
+            step_zone(self.xs, self.ys, self.dirs, 0, WRAP_LOW, WRAP_HIGH)
+
+    def pack(self):
+        """Dashboard-ready snapshot (see encode_vehicles), so the master can forward it without re-encoding."""
+        n = self.count
+        return encode_vehicles(self.xs[:n], self.ys[:n], DIRECTION_BYTES[self.dirs[:n]].tobytes())
+
+def encode_vehicles(xs, ys, dir_letters):
+    """Base64 blob for the browser: int16 xs, int16 ys, then one ASCII direction letter per car."""
+    xs = np.rint(xs).astype('<i2') # Whole pixels are all the canvas needs
+    ys = np.rint(ys).astype('<i2')
+    return base64.b64encode(xs.tobytes() + ys.tobytes() + dir_letters).decode('ascii')
 
 class TrafficLight:
+    __slots__ = ('x', 'y', 'state', 'last_change_time', 'cycle_time', 'cached_state')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
         self.state = 'red' # 'red', 'green'
-        self.last_change_time = time.time()
+        self.last_change_time = time.monotonic()
         self.cycle_time = 2 # Slightly faster traffic light cycle (e.g., 2 seconds per state, WAS 3)
+        self.cached_state = {'x': x, 'y': y, 'state': self.state} # Rebuilt only when the light flips
 
-    def update(self):
-        if time.time() - self.last_change_time > self.cycle_time:
+    def update(self, now):
+        """Advance the light to `now`, a time.monotonic() value sampled once per tick."""
+        if now - self.last_change_time > self.cycle_time:
             self.state = 'green' if self.state == 'red' else 'red'
-            self.last_change_time = time.time()
+            self.last_change_time = now
+            self.cached_state = {'x': self.x, 'y': self.y, 'state': self.state}
 
     def get_state(self):
-        return {'x': self.x, 'y': self.y, 'state': self.state}
+        return self.cached_state # Shared and never mutated; callers must not modify it
 
 # =============================================================================
 # Master Node Logic
 # =============================================================================
 
-@app.route('/')
-def index():
-    """Master UI with live canvas visualization."""
-    status_html = """
+# The dashboard page is static (everything dynamic arrives over SSE), so it is built once at import
+# and served with an ETag; reloads get a 304 instead of the whole page.
+INDEX_HTML = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -161,6 +425,8 @@ def index():
             .simulation-container { display: flex; flex-wrap: wrap; justify-content: center; gap: 20px; margin-top: 30px; }
             .zone-canvas-wrapper { border: 2px solid #cbd5e1; border-radius: 8px; overflow: hidden; box-shadow: 0 4px 10px rgba(0,0,0,0.05); }
             canvas { background-color: #f0fdf4; display: block; border-radius: 6px; } /* Light green background for roads */
+            .zone-canvas-stack { position: relative; }
+            .zone-canvas-stack canvas.zone-dynamic { position: absolute; top: 0; left: 0; background-color: transparent; } /* Cars + light over the static roads */
             .footer { text-align: center; padding: 1rem; color: #64748b; font-size: 0.9rem; margin-top: auto; }
             .status-indicator { display: inline-block; width: 12px; height: 12px; border-radius: 50%; margin-right: 8px; }
             .status-active { background-color: #22c55e; }
@@ -243,26 +509,91 @@ def index():
                 document.getElementById('lastUpdated').textContent = `Last updated: ${new Date().toLocaleString()}`;
             }
 
+            let workersState = {}; // Worker details accumulated from keyframes and deltas
+            // Everything received since the last paint, coalesced; applied by flushPendingFrame()
+            let pendingFrame = {metrics: null, workersChanged: false, history: null, points: [], zones: {}};
+            let rafScheduled = false;
+            const lastZoneSig = {}; // {zone_name: signature of what its canvas currently shows}
+
+            function flushPendingFrame() {
+                rafScheduled = false;
+                const frame = pendingFrame;
+                pendingFrame = {metrics: null, workersChanged: false, history: null, points: [], zones: {}};
+
+                if (frame.metrics) {
+                    updateDashboardMetrics(frame.metrics);
+                }
+                if (frame.workersChanged) {
+                    updateWorkersList(workersState);
+                }
+
+                if (frame.history) {
+                    createOrUpdateChart(frame.history.map(item => ({x: item[0], y: item[1]})));
+                }
+                if (frame.points.length > 0) {
+                    if (!totalCarsChart) { // Fallback if chart somehow wasn't initialized on initial_data
+                        createOrUpdateChart([]);
+                    }
+                    for (const point of frame.points) {
+                        addDataToChart(point[0], point[1]);
+                    }
+                    trimChart();
+                    totalCarsChart.update('none'); // One redraw for all new points
+                }
+
+                // Update live simulation visualization for each zone (deltas only list zones that changed)
+                for (const zoneName in frame.zones) {
+                    const zone = frame.zones[zoneName];
+                    // Skip decoding and drawing when the zone looks exactly as it did last paint
+                    const sig = zone.vehicles_b64 + ':' + (zone.traffic_light ? zone.traffic_light.state : '');
+                    if (sig === lastZoneSig[zoneName]) continue;
+                    lastZoneSig[zoneName] = sig;
+                    const ctx = getOrCreateCanvas(zoneName);
+                    drawZone(ctx, decodeVehicles(zone.vehicles_b64), zone.traffic_light);
+                }
+            }
+
+
+            const workerNodes = {}; // {zone_name: {item, urlEl, lastSeenEl, carsEl}} built once per zone
+
+            function setText(el, text) {
+                if (el.textContent !== text) el.textContent = text; // Untouched text means no layout work
+            }
+
             function updateWorkersList(workers_data) {
                 const workersListDiv = document.getElementById('workersList');
-                workersListDiv.innerHTML = ''; // Clear previous list
                 if (Object.keys(workers_data).length === 0) {
                     workersListDiv.innerHTML = '<p class="text-gray-600 pl-4">No workers currently registered.</p>';
-                } else {
-                    let html = '';
-                    for (const zoneName in workers_data) {
-                        const worker = workers_data[zoneName];
-                        html += `
-                            <div class="worker-item">
-                                <span class="font-bold">${zoneName} Zone:</span> 
-                                URL: ${worker.url}, 
-                                Last Seen: ${new Date(worker.last_seen * 1000).toLocaleTimeString()}, 
-                                Cars: ${worker.car_count}
-                            </div>
-                        `;
+                    for (const zoneName in workerNodes) delete workerNodes[zoneName];
+                    return;
+                }
+                if (Object.keys(workerNodes).length === 0) {
+                    workersListDiv.textContent = ''; // Drop the "No workers" placeholder
+                }
+
+                // New zones get their row built once and appended in one batch
+                const fragment = document.createDocumentFragment();
+                for (const zoneName in workers_data) {
+                    if (!workerNodes[zoneName]) {
+                        const item = document.createElement('div');
+                        item.className = 'worker-item';
+                        const label = document.createElement('span');
+                        label.className = 'font-bold';
+                        label.textContent = `${zoneName} Zone:`;
+                        const urlEl = document.createElement('span');
+                        const lastSeenEl = document.createElement('span');
+                        const carsEl = document.createElement('span');
+                        item.append(label, ' URL: ', urlEl, ', Last Seen: ', lastSeenEl, ', Cars: ', carsEl);
+                        workerNodes[zoneName] = { item, urlEl, lastSeenEl, carsEl };
+                        fragment.appendChild(item);
                     }
-                    workersListDiv.innerHTML = html;
+                    const worker = workers_data[zoneName];
+                    const nodes = workerNodes[zoneName];
+                    setText(nodes.urlEl, String(worker.url));
+                    setText(nodes.lastSeenEl, new Date(worker.last_seen * 1000).toLocaleTimeString());
+                    setText(nodes.carsEl, String(worker.car_count));
                 }
+                workersListDiv.appendChild(fragment);
             }
 
 
@@ -270,29 +601,30 @@ def index():
             const ctx = document.getElementById('totalCarsChart').getContext('2d');
             let totalCarsChart = null; // Initialize to null to indicate no chart is present yet
 
-            function createOrUpdateChart(labels, data) {
+            // Points are {x: step, y: total}; the server only sends a point when the total changed
+            function createOrUpdateChart(points) {
                 if (!totalCarsChart) {
                     // Create the chart instance only once
                     totalCarsChart = new Chart(ctx, {
                         type: 'line',
                         data: {
-                            labels: labels,
                             datasets: [{
                                 label: 'Total Cars in Simulation',
-                                data: data,
+                                data: points,
                                 borderColor: 'rgb(75, 192, 192)',
-                                tension: 0.1,
+                                stepped: 'after', // A total holds until the next point, so flat stretches stay flat
                                 fill: false
                             }]
                         },
                         options: {
                             responsive: true,
                             maintainAspectRatio: false,
-                            animation: {
-                                duration: 0 // Disable animation for faster real-time updates
-                            },
+                            animation: false, // Fully off (duration 0 still runs the animation loop)
+                            animations: { colors: false, x: false, y: false },
                             scales: {
                                 x: {
+                                    type: 'linear', // Steps keep their real spacing even where points were skipped
+                                    ticks: { precision: 0 },
                                     title: {
                                         display: true,
                                         text: 'Simulation Step'
@@ -310,25 +642,26 @@ def index():
                     });
                 } else {
                     // If chart already exists, update its data and refresh
-                    totalCarsChart.data.labels = labels;
-                    totalCarsChart.data.datasets[0].data = data;
-                    totalCarsChart.update();
+                    totalCarsChart.data.datasets[0].data = points;
+                    totalCarsChart.update('none');
+                }
+            }
+
+            const maxPoints = 100; // Matches the server's history length
+
+            // Drop the oldest points in one splice, however many a burst of frames added
+            function trimChart() {
+                const excess = totalCarsChart.data.datasets[0].data.length - maxPoints;
+                if (excess > 0) {
+                    totalCarsChart.data.datasets[0].data.splice(0, excess);
                 }
             }
 
-            // This function now just pushes new data to an existing chart
-            function addDataToChart(newLabel, newData) {
+            // This function now just pushes new data to an existing chart (without redrawing)
+            function addDataToChart(step, totalCars) {
                 if (totalCarsChart) { // Only add data if chart exists
-                    totalCarsChart.data.labels.push(newLabel);
-                    totalCarsChart.data.datasets[0].data.push(newData);
-                    
-                    const maxPoints = 100;
-                    if (totalCarsChart.data.labels.length > maxPoints) {
-                        totalCarsChart.data.labels.shift();
-                        totalCarsChart.data.datasets[0].data.shift();
-                    }
-                    totalCarsChart.update();
-                    console.log(`Chart updated: Step ${newLabel}, Cars: ${newData}`); // NEW: Log chart updates
+                    totalCarsChart.data.datasets[0].data.push({x: step, y: totalCars});
+                    // The caller trims and redraws once after adding all of a frame's points
                 } else {
                     console.warn("Chart not initialized when addDataToChart was called.");
                 }
@@ -365,13 +698,26 @@ def index():
                     zoneLabel.className = 'text-center text-lg font-semibold py-2 bg-gray-100 border-b border-gray-200';
                     zoneLabel.textContent = `${zoneName} Zone`;
                     
+                    // Two stacked canvases: roads are drawn once on the bottom one, frames only repaint the top one
+                    const stack = document.createElement('div');
+                    stack.className = 'zone-canvas-stack';
+
+                    const staticCanvas = document.createElement('canvas');
+                    staticCanvas.id = `static-${zoneName}`;
+                    staticCanvas.width = ZONE_SIZE;
+                    staticCanvas.height = ZONE_SIZE;
+                    drawRoads(staticCanvas.getContext('2d'));
+
                     const canvas = document.createElement('canvas');
                     canvas.id = `canvas-${zoneName}`;
+                    canvas.className = 'zone-dynamic';
                     canvas.width = ZONE_SIZE;
                     canvas.height = ZONE_SIZE;
                     
+                    stack.appendChild(staticCanvas);
+                    stack.appendChild(canvas);
                     canvasWrapper.appendChild(zoneLabel);
-                    canvasWrapper.appendChild(canvas);
+                    canvasWrapper.appendChild(stack);
                     container.appendChild(canvasWrapper);
 
                     canvasMap[zoneName] = canvas.getContext('2d');
@@ -380,32 +726,55 @@ def index():
                 return canvasMap[zoneName];
             }
 
-            function drawZone(ctx, vehicles, trafficLight) {
-                ctx.clearRect(0, 0, ZONE_SIZE, ZONE_SIZE); // Clear previous frame
+            // Vehicles arrive base64-packed: n little-endian int16 xs, n int16 ys, then n ASCII direction bytes
+            const DIR_E = 69, DIR_W = 87, DIR_S = 83, DIR_N = 78; // 'E', 'W', 'S', 'N'
+
+            function decodeVehicles(b64) {
+                if (!b64) return null;
+                const bin = atob(b64);
+                const bytes = new Uint8Array(bin.length);
+                for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+                const n = bytes.length / 5;
+                const view = new DataView(bytes.buffer);
+                const xs = new Int16Array(n), ys = new Int16Array(n);
+                for (let i = 0; i < n; i++) {
+                    xs[i] = view.getInt16(2 * i, true);
+                    ys[i] = view.getInt16(2 * (n + i), true);
+                }
+                return { xs: xs, ys: ys, dirs: bytes.subarray(4 * n) };
+            }
 
+            // Roads never change, so they are drawn once onto each zone's static (bottom) canvas
+            function drawRoads(ctx) {
                 // Draw roads (a simple crossroad)
                 ctx.fillStyle = '#6b7280'; // Dark grey for roads
                 ctx.fillRect(0, ZONE_SIZE / 2 - ROAD_WIDTH / 2, ZONE_SIZE, ROAD_WIDTH); // Horizontal road
                 ctx.fillRect(ZONE_SIZE / 2 - ROAD_WIDTH / 2, 0, ROAD_WIDTH, ZONE_SIZE); // Vertical road
+            }
 
-                // Draw vehicles
-                ctx.fillStyle = '#ef4444'; // Red cars
-                if (vehicles && vehicles.length > 0) {
-                    vehicles.forEach(car => {
-                        ctx.fillRect(car.x, car.y, CAR_SIZE, CAR_SIZE);
-                        // Optional: Direction indicator for debugging/visual
-                        ctx.fillStyle = 'white';
-                        if (car.direction === 'E') ctx.fillRect(car.x + CAR_SIZE - 2, car.y + CAR_SIZE / 2 - 1, 2, 2);
-                        else if (car.direction === 'W') ctx.fillRect(car.x, car.y + CAR_SIZE / 2 - 1, 2, 2);
-                        else if (car.direction === 'S') ctx.fillRect(car.x + CAR_SIZE / 2 - 1, car.y + CAR_SIZE - 2, 2, 2);
-                        else if (car.direction === 'N') ctx.fillRect(car.x + CAR_SIZE / 2 - 1, car.y, 2, 2);
-                    });
-                    // console.log(`Drew ${vehicles.length} cars for zone: ${ctx.canvas.id.replace('canvas-', '')}`); // NEW: Log car drawing
-                } else {
-                    // console.log(`No vehicles to draw for zone: ${ctx.canvas.id.replace('canvas-', '')}`); // NEW: Log if no cars
+            function drawZone(ctx, vehicles, trafficLight) {
+                ctx.clearRect(0, 0, ZONE_SIZE, ZONE_SIZE); // Clear previous frame (dynamic layer only; roads show through)
+
+                // Draw vehicles (decoded columns: vehicles.xs[i], vehicles.ys[i], vehicles.dirs[i]).
+                // All bodies go into one path and all direction indicators into another: two fills, no style flips.
+                if (vehicles && vehicles.xs.length > 0) {
+                    const xs = vehicles.xs, ys = vehicles.ys, dirs = vehicles.dirs;
+                    const bodies = new Path2D();
+                    const indicators = new Path2D();
+                    for (let i = 0; i < xs.length; i++) {
+                        const x = xs[i], y = ys[i], direction = dirs[i];
+                        bodies.rect(x, y, CAR_SIZE, CAR_SIZE);
+                        if (direction === DIR_E) indicators.rect(x + CAR_SIZE - 2, y + CAR_SIZE / 2 - 1, 2, 2);
+                        else if (direction === DIR_W) indicators.rect(x, y + CAR_SIZE / 2 - 1, 2, 2);
+                        else if (direction === DIR_S) indicators.rect(x + CAR_SIZE / 2 - 1, y + CAR_SIZE - 2, 2, 2);
+                        else if (direction === DIR_N) indicators.rect(x + CAR_SIZE / 2 - 1, y, 2, 2);
+                    }
+                    ctx.fillStyle = '#ef4444'; // Red cars
+                    ctx.fill(bodies);
+                    ctx.fillStyle = 'white'; // Direction indicator
+                    ctx.fill(indicators);
                 }
 
-
                 // Draw traffic light
                 if (trafficLight) {
                     ctx.beginPath();
@@ -422,7 +791,7 @@ def index():
             // --- Server-Sent Events (SSE) Listener ---
             let eventSource;
             let reconnectAttempts = 0;
-            const maxReconnectAttempts = 5;
+            const maxReconnectDelay = 30000; // Backoff ceiling; a full server (503) frees up once a viewer leaves
 
             function connectSSE() {
                 // Ensure any old connection is properly closed before creating a new one
@@ -438,41 +807,41 @@ def index():
                         const data = JSON.parse(event.data);
                         console.log("Received SSE update (data.type:", data.type, "):", data); // IMPORTANT: Keep this log for debugging
 
-                        // Update main dashboard metrics with every update
-                        updateDashboardMetrics({
+                        // Only record the frame here; the DOM, chart and canvases are touched once per display frame
+                        pendingFrame.metrics = {
                             status: data.status,
                             step: data.step,
                             total_cars: data.total_cars,
                             num_workers: data.num_workers
-                        });
-                        updateWorkersList(data.registered_workers);
+                        };
+                        // Keyframes replace the worker details; deltas only carry changed fields (often none)
+                        if (data.type === 'initial_data') {
+                            workersState = data.registered_workers;
+                            pendingFrame.workersChanged = true;
+                        } else {
+                            for (const zoneName in data.registered_workers) {
+                                workersState[zoneName] = Object.assign(workersState[zoneName] || {}, data.registered_workers[zoneName]);
+                                pendingFrame.workersChanged = true;
+                            }
+                        }
 
                         // Handle chart: on initial_data (or reconnect), re-initialize/reset with full history.
-                        // On 'update', just add the latest data point.
+                        // On 'delta', just queue the new data points.
                         if (data.type === 'initial_data') {
-                            if (data.history && data.history.length > 0) {
-                                createOrUpdateChart(data.history.map(item => item[0]), data.history.map(item => item[1]));
-                            } else {
-                                // If initial_data has no history, ensure chart is cleared or initialized empty
-                                createOrUpdateChart([], []);
-                            }
-                        } else if (data.type === 'update') {
-                            if (totalCarsChart) { // Only update if chart exists
-                                addDataToChart(data.step, data.total_cars);
-                            } else { // Fallback if chart somehow wasn't initialized on initial_data
-                                createOrUpdateChart([data.step], [data.total_cars]);
-                            }
+                            pendingFrame.history = data.history || [];
+                            pendingFrame.points = [];
+                        } else if (data.type === 'delta') {
+                            pendingFrame.points.push(...data.history_points);
                         }
 
-                        // Update live simulation visualization for each zone
-                        // console.log("Processing zone data:", data.zone_data); // Keep this log for debugging
+                        // Zones: only the latest state of each matters, older ones are dropped unpainted
                         if (data.zone_data) {
-                            for (const zoneName in data.zone_data) {
-                                const ctx = getOrCreateCanvas(zoneName);
-                                drawZone(ctx, data.zone_data[zoneName].vehicles, data.zone_data[zoneName].traffic_light);
-                            }
-                        } else {
-                            console.warn("No zone_data received in SSE update.");
+                            Object.assign(pendingFrame.zones, data.zone_data);
+                        }
+
+                        if (!rafScheduled) {
+                            rafScheduled = true;
+                            requestAnimationFrame(flushPendingFrame);
                         }
 
                     } catch (error) {
@@ -484,14 +853,12 @@ def index():
                     console.error('SSE error:', error); // IMPORTANT: Keep this log for debugging
                     eventSource.close(); // Explicitly close the faulty connection
                     
-                    if (reconnectAttempts < maxReconnectAttempts) {
-                        reconnectAttempts++;
-                        console.log(`Attempting to reconnect SSE in 3 seconds (${reconnectAttempts}/${maxReconnectAttempts})...`);
-                        setTimeout(connectSSE, 3000); // Try to reconnect after 3 seconds
-                    } else {
-                        console.error('Max SSE reconnection attempts reached. Please check server logs or network.');
-                        // Optionally display a user-facing message here
-                    }
+                    // EventSource hides the status code, so every failure (including a 503 when the
+                    // stream cap is reached) is retried forever: 3s, 6s, 12s, ... up to maxReconnectDelay
+                    const delay = Math.min(3000 * 2 ** reconnectAttempts, maxReconnectDelay);
+                    reconnectAttempts++;
+                    console.log(`Attempting to reconnect SSE in ${delay / 1000} seconds (attempt ${reconnectAttempts})...`);
+                    setTimeout(connectSSE, delay);
                 };
 
                 eventSource.onopen = function() {
@@ -520,66 +887,163 @@ def index():
     </body>
     </html>
     """
-    # The Python side's index() route no longer needs to pass initial values,
-    # as the JavaScript handles all dynamic rendering via SSE.
-    return render_template_string(status_html,
-        status="Inactive", # Initial status, will be overwritten by JS
-        status_class="status-inactive", # Initial class
-        current_step=0, # Initial values, overwritten by JS
-        total_cars=0,
-        num_workers=0,
-        workers_html='<p class="text-gray-600 pl-4">No workers currently registered.</p>', # Initial HTML
-        last_updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    )
+INDEX_ETAG = hashlib.md5(INDEX_HTML.encode('utf-8')).hexdigest()
+
+@app.route('/')
+def index():
+    """Master UI with live canvas visualization."""
+    response = Response(INDEX_HTML, mimetype='text/html')
+    response.set_etag(INDEX_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
 
+def pack_vehicles(vehicles):
+    """Pack a per-car list ([{'id', 'x', 'y', 'direction'}, ...]) from workers that do not send `vehicles_b64`.
+
+    Raises ValueError if the list is not in that shape.
+    """
+    if not vehicles:
+        return ''
+    try:
+        xs = np.array([car['x'] for car in vehicles], dtype=np.float32)
+        ys = np.array([car['y'] for car in vehicles], dtype=np.float32)
+        dir_letters = ''.join(car['direction'] for car in vehicles).encode('ascii')
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError(f"Malformed vehicles: {e!r}") from e
+    if len(dir_letters) != len(xs): # One letter per car
+        raise ValueError("Malformed vehicles: direction must be a single letter")
+    return encode_vehicles(xs, ys, dir_letters)
+
+def build_sse_frames():
+    """Snapshot the master state for the dashboard as a keyframe plus a delta against the last publish."""
+    global published_workers, published_history_step
+    history_snapshot = list(graph_data_history)
+    current_total_cars = total_cars # Maintained on write
+
+    workers = registered_workers # Immutable snapshot (copy-on-write)
+    # Create a copy of the registered_workers details for JSON serialization
+    current_registered_workers_details = {zone: {
+        'url': data['url'],
+        'last_seen': int(data['last_seen']), # The dashboard shows whole seconds; coarser values change less often
+        'car_count': data['car_count'],
+        'id': data['id']
+    } for zone, data in workers.items()}
+
+    grid_snapshot = full_simulation_grid_data # Immutable snapshot (copy-on-write), no lock needed
+
+    # Zone entries are replaced (never mutated) on every worker update, so identity tells us what changed.
+    # Vehicles were packed when the update arrived, so they are forwarded as-is.
+    changed_zones = {}
+    for zone, zone_data in grid_snapshot.items():
+        if published_zone_data.get(zone) is not zone_data:
+            published_zone_data[zone] = changed_zones[zone] = zone_data
+
+    # Only the fields of each worker that differ from what was last sent
+    changed_workers = {}
+    for zone, details in current_registered_workers_details.items():
+        previous = published_workers.get(zone, {})
+        fields = {key: value for key, value in details.items() if previous.get(key) != value}
+        if fields:
+            changed_workers[zone] = fields
+    published_workers = current_registered_workers_details
+
+    new_history_points = [point for point in history_snapshot if point[0] > published_history_step]
+    if history_snapshot:
+        published_history_step = history_snapshot[-1][0]
+
+    common = {
+        'status': "Active" if simulation_active else "Inactive",
+        'step': simulation_step,
+        'total_cars': current_total_cars,
+        'num_workers': len(workers)
+    }
+    keyframe = dict(common,
+        type='initial_data',
+        history=history_snapshot, # Full history so (re)connecting clients can rebuild the chart
+        zone_data=dict(published_zone_data), # Current state of all zones
+        registered_workers=current_registered_workers_details)
+    delta = dict(common,
+        type='delta',
+        history_points=new_history_points, # The client accumulates these into its chart
+        zone_data=changed_zones,
+        registered_workers=changed_workers)
+    return keyframe, delta
+
+def publish_state():
+    """Serialize the keyframe and delta once for every SSE stream and wake the streams waiting on state_cv."""
+    global state_version, latest_sse_frame
+    keyframe, delta = build_sse_frames()
+    keyframe_frame = b"data: " + json_dumps(keyframe) + b"\n\n"
+    frame = b"data: " + json_dumps(delta) + b"\n\n"
+    with state_cv:
+        state_version += 1
+        latest_sse_frame = (keyframe_frame, frame)
+        state_cv.notify_all()
+
+def sse_emitter_loop():
+    """Background thread publishing the latest state at a fixed cadence when something changed."""
+    while True:
+        time.sleep(SSE_EMIT_INTERVAL)
+        if state_dirty.is_set() and sse_subscribers: # Stays dirty until someone is watching
+            state_dirty.clear()
+            publish_state()
 
 # SSE Endpoint for streaming data to the browser
 @app.route('/stream_data')
 def stream_data():
-    def generate_data():
-        last_step_sent = -1
-        while True:
-            # Acquire locks for consistent data access
-            with graph_data_lock, full_simulation_grid_data_lock:
-                current_total_cars = sum(data['car_count'] for data in registered_workers.values())
-                current_simulation_step = simulation_step
-                current_status = "Active" if simulation_active else "Inactive"
-                current_num_workers = len(registered_workers)
-                
-                # Create a copy of the registered_workers details for JSON serialization
-                current_registered_workers_details = {zone: {
-                    'url': data['url'],
-                    'last_seen': data['last_seen'],
-                    'car_count': data['car_count'],
-                    'id': data['id']
-                } for zone, data in registered_workers.items()}
-
-            # Only send if the global simulation step has advanced since last sent
-            # or if it's the very first time sending (step 0 or initial_data)
-            if current_simulation_step > last_step_sent or (current_simulation_step == 0 and last_step_sent == -1):
-                latest_total_cars_data = graph_data_history[-1] if graph_data_history else (0,0)
-                
-                payload = {
-                    'type': 'update', # Default to update
-                    'status': current_status,
-                    'step': current_simulation_step,
-                    'total_cars': current_total_cars,
-                    'num_workers': current_num_workers,
-                    'history': list(graph_data_history), # Always send full history for potential client reconnects
-                    'zone_data': dict(full_simulation_grid_data), # Send current state of all zones
-                    'registered_workers': current_registered_workers_details
-                }
-                
-                if last_step_sent == -1: # This is the first data payload sent over this specific SSE connection
-                    payload['type'] = 'initial_data'
-                    
-                yield f"data: {json.dumps(payload)}\n\n"
-                last_step_sent = current_simulation_step
-            time.sleep(0.5) # Send updates twice per second for smoother animation
+    global sse_subscribers
+    # Each stream pins a pool thread under waitress; refuse rather than starve the worker-facing endpoints
+    with state_cv:
+        if waitress_serve is not None and sse_subscribers >= MAX_SSE_SUBSCRIBERS:
+            return Response("Too many dashboard streams open, try again later\n", status=503,
+                            mimetype='text/plain', headers={'Retry-After': '10'})
+        sse_subscribers += 1
 
-    return Response(generate_data(), mimetype='text/event-stream', 
-                    headers={'Cache-Control': 'no-cache', 'Connection': 'keep-alive'})
+    # gzip the stream when the browser allows it; each event is sync-flushed so it is never held back
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
 
+    def generate_data():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None # wbits=31: gzip container
+        last_version = -1
+        sent_keyframe = False
+        while True:
+            # Sleep until the master publishes something new; idle connections cost no CPU
+            with state_cv:
+                changed = state_cv.wait_for(lambda: state_version != last_version, timeout=SSE_KEEPALIVE_SECONDS)
+                previous_version, last_version = last_version, state_version
+                keyframe_frame, frame = latest_sse_frame
+            if not changed:
+                chunk = b": keepalive\n\n"
+            elif keyframe_frame is None: # Nothing published yet
+                continue
+            elif sent_keyframe and last_version == previous_version + 1:
+                chunk = frame # Client holds the previous version, so the shared delta is enough
+            else:
+                # First frame over this connection, or we missed a version: resend the full snapshot
+                chunk = keyframe_frame # Encoded once per publish, shared by every (re)connecting client
+                sent_keyframe = True
+
+            if compressor is not None:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+
+    def release():
+        # Runs when the server closes the stream (client gone or shutdown), even if it never started
+        global sse_subscribers
+        with state_cv:
+            sse_subscribers -= 1
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+        'X-Accel-Buffering': 'no' # Stop nginx-style reverse proxies from buffering the stream
+    } # Connection is hop-by-hop; the server keeps the stream open
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    # Every chunk is already bytes, so hand the generator straight to the server
+    # (direct passthrough skips Response.close, so the slot is released by the iterator's own close())
+    return Response(ClosingIterator(generate_data(), release), mimetype='text/event-stream', headers=headers, direct_passthrough=True)
 
 @app.route('/register_worker', methods=['POST'])
 def register_worker():
@@ -592,77 +1056,207 @@ def register_worker():
     if not zone or not worker_url or not worker_id:
         return jsonify({"error": "Missing zone, worker_url, or worker_id"}), 400
 
-    registered_workers[zone] = {
-        'url': worker_url,
-        'last_seen': time.time(),
-        'car_count': 0,
-        'id': worker_id,
-        'current_zone_data': {'vehicles': [], 'traffic_light': None} # Initialize detailed zone data
-    }
+    add_registered_worker(zone, worker_url, worker_id)
+    # The current step lets the worker report its initial state right away instead of waiting for the next step
+    return jsonify({"message": f"Worker {worker_id} registered successfully", "step": simulation_step,
+                    "update_formats": UPDATE_FORMATS})
+
+def add_registered_worker(zone, worker_url, worker_id):
+    """Record the owner of a zone (an HTTP worker or a local zone process)."""
+    global registered_workers, total_cars
+    with registered_workers_write_lock:
+        workers = dict(registered_workers)
+        previous = workers.get(zone)
+        workers[zone] = {
+            'url': worker_url,
+            'last_seen': time.time(),
+            'car_count': 0,
+            'step': simulation_step, # Last step this zone reported; a newcomer starts at the current one
+            'id': worker_id,
+            'current_zone_data': {'vehicles_b64': '', 'traffic_light': None} # Initialize detailed zone data
+        }
+        registered_workers = workers
+        if previous is not None:
+            total_cars -= previous['car_count'] # A re-registering zone restarts at 0
+    with state_cv:
+        state_cv.notify_all() # Wake the master if it is waiting for workers to register
     print(f"Master: Registered worker {worker_id} for zone {zone} at {worker_url}")
-    return jsonify({"message": f"Worker {worker_id} registered successfully"})
+    state_dirty.set() # So dashboards opened before the first step list the worker
+
+def apply_traffic_update(zone, worker_id_from_update, car_count, zone_vehicles_b64, zone_traffic_light, step):
+    """Store a worker's latest zone state (vehicles already packed) for `step`. Returns False if the worker is unknown or mismatched."""
+    global registered_workers, full_simulation_grid_data, total_cars
+    with registered_workers_write_lock:
+        worker_info = registered_workers.get(zone)
+        if worker_info is not None and worker_info['id'] == worker_id_from_update:
+            if zone_traffic_light is None: # Workers only send the light when it changed
+                zone_traffic_light = worker_info['current_zone_data']['traffic_light']
+            workers = dict(registered_workers)
+            workers[zone] = dict(worker_info,
+                car_count=car_count,
+                step=max(step, worker_info['step']),
+                last_seen=time.time(),
+                current_zone_data={
+                    'vehicles_b64': zone_vehicles_b64,
+                    'traffic_light': zone_traffic_light
+                })
+            registered_workers = workers
+            total_cars += car_count - worker_info['car_count']
+
+            grid = dict(full_simulation_grid_data)
+            grid[zone] = workers[zone]['current_zone_data'] # Same immutable entry; never mutated in place
+            full_simulation_grid_data = grid
+            record_history_point(workers)
+        else:
+            worker_info = None
+
+    if worker_info is not None:
+        state_dirty.set() # Zone changed: the emitter pushes it out without waiting for the step to finish
+        return True
+
+    print(f"Master: Received update from unknown/mismatched worker {worker_id_from_update} for zone {zone}")
+    return False
+
+def record_history_point(workers):
+    """Chart the newest step every live zone has reported (called under registered_workers_write_lock)."""
+    global charted_step
+    cutoff = time.time() - STALE_WORKER_SECONDS
+    reported = [info['step'] for info in workers.values() if info['last_seen'] >= cutoff]
+    if not reported or min(reported) <= charted_step:
+        return
+    charted_step = min(reported)
+    # Only chart changes: flat stretches add no points, keeping the 100-point window informative
+    if not graph_data_history or graph_data_history[-1][1] != total_cars:
+        graph_data_history.append((charted_step, total_cars))
 
 @app.route('/traffic_update', methods=['POST'])
 def traffic_update():
     """Endpoint for workers to send traffic updates to the master."""
-    global total_cars_in_sim
-    data = request.json
+    data = decode_update(request)
+    if data is None:
+        return jsonify({"error": "Unsupported update encoding, send JSON"}), 415
     zone = data.get('zone')
-    car_count = data.get('car_count', 0)
     worker_id_from_update = data.get('worker_id')
-    
-    zone_vehicles = data.get('vehicles', [])
-    zone_traffic_light = data.get('traffic_light')
 
     if not zone or 'car_count' not in data or not worker_id_from_update:
         return jsonify({"error": "Missing zone, car_count, or worker_id"}), 400
 
-    if zone in registered_workers and registered_workers[zone]['id'] == worker_id_from_update:
-        old_car_count = registered_workers[zone]['car_count']
-        registered_workers[zone]['car_count'] = car_count
-        registered_workers[zone]['last_seen'] = time.time()
-        
-        registered_workers[zone]['current_zone_data'] = {
-            'vehicles': zone_vehicles,
-            'traffic_light': zone_traffic_light
-        }
+    vehicles_b64 = data.get('vehicles_b64') # Packed by the worker; older workers send a per-car 'vehicles' list
+    if vehicles_b64 is None:
+        try:
+            vehicles_b64 = pack_vehicles(data.get('vehicles'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    if apply_traffic_update(zone, worker_id_from_update, data['car_count'], vehicles_b64, data.get('traffic_light'), data.get('step', simulation_step)):
+        return jsonify({"message": "Update received"})
+    return jsonify({"error": "Worker not registered or ID mismatch"}), 404
+
+@app.route('/traffic_update_batch', methods=['POST'])
+def traffic_update_batch():
+    """Endpoint for workers to send several buffered simulation steps in one request."""
+    data = decode_update(request)
+    if data is None:
+        return jsonify({"error": "Unsupported update encoding, send JSON"}), 415
+    zone = data.get('zone')
+    worker_id_from_update = data.get('worker_id')
+    batch = data.get('batch')
 
-        # Ensure total_cars_in_sim is updated accurately
-        # It's safer to re-sum all worker car counts than to do a delta if updates can be missed/out of order
-        # For simplicity, we stick to delta as it's typically faster, but acknowledge its limitations.
-        total_cars_in_sim += (car_count - old_car_count) 
+    if not zone or not worker_id_from_update or not batch:
+        return jsonify({"error": "Missing zone, worker_id, or batch"}), 400
 
-        # Update simulation grid data with proper locking
-        with full_simulation_grid_data_lock:
-            full_simulation_grid_data[zone] = {
-                'vehicles': zone_vehicles,
-                'traffic_light': zone_traffic_light
-            }
+    # Snapshots arrive in step order and each one supersedes the previous, so only
+    # the newest (the only one carrying vehicles_b64, plus traffic_light if it changed) is applied.
+    latest = batch[-1]
+    vehicles_b64 = latest.get('vehicles_b64')
+    if vehicles_b64 is None:
+        try:
+            vehicles_b64 = pack_vehicles(latest.get('vehicles'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    if apply_traffic_update(zone, worker_id_from_update, latest.get('car_count', 0), vehicles_b64, latest.get('traffic_light'), latest.get('step', simulation_step)):
+        return jsonify({"message": f"Batch of {len(batch)} updates received"})
+    return jsonify({"error": "Worker not registered or ID mismatch"}), 404
+
+def send_step_to_worker(zone, worker_url, body):
+    """Tell one worker to perform a simulation step (runs on step_executor; thread-pool fallback)."""
+    try:
+        response = http_session.post(
+            f"{worker_url}/simulate_step",
+            data=body,
+            headers=JSON_HEADERS,
+            timeout=3 # Short timeout for worker response
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Master: Error communicating with worker {zone} at {worker_url}: {e}")
+        # Consider logic to mark worker as down or remove it
+
+class AsyncStepFanout:
+    """Event loop on its own thread that posts each step to every worker concurrently with aiohttp."""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.session = asyncio.run_coroutine_threadsafe(self._create_session(), self.loop).result()
+
+    async def _create_session(self):
+        # Keep-alive pool shared by all steps, like http_session on the blocking path
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=16, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=3) # Short timeout for worker response
+        )
 
-        return jsonify({"message": "Update received"})
+    async def _post_step(self, zone, worker_url, body):
+        try:
+            async with self.session.post(f"{worker_url}/simulate_step", data=body, headers=JSON_HEADERS) as response:
+                response.raise_for_status()
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Master: Error communicating with worker {zone} at {worker_url}: {e!r}")
+
+    async def _fan_out(self, workers, body):
+        await asyncio.gather(*(self._post_step(zone, info['url'], body) for zone, info in workers.items()))
+
+    def run(self, workers, body):
+        """Block the calling thread until every worker has acknowledged the step in `body` (or timed out)."""
+        asyncio.run_coroutine_threadsafe(self._fan_out(workers, body), self.loop).result()
+
+async_fanout = None # Created by the master loop when aiohttp is available
+
+def dispatch_step(step):
+    """Send `step` to every registered worker in parallel and wait for all of them."""
+    workers = registered_workers # Snapshot; registrations swap in a new dict
+    body = json_dumps({"step": step, "master_id": "master_123"}) # Serialized once (orjson if available) for every worker
+    if async_fanout is not None:
+        async_fanout.run(workers, body)
     else:
-        print(f"Master: Received update from unknown/mismatched worker {worker_id_from_update} for zone {zone}")
-        return jsonify({"error": "Worker not registered or ID mismatch"}), 404
+        futures = [step_executor.submit(send_step_to_worker, zone, worker_info['url'], body)
+                   for zone, worker_info in workers.items()]
+        concurrent.futures.wait(futures, timeout=3)
 
-def master_simulation_loop(duration=None, test_mode=False):
-    """Main simulation loop for the master node."""
-    global simulation_step, total_cars_in_sim, simulation_active, simulation_start_time, step_start_time, step_times
+def master_simulation_loop(duration=None, test_mode=False, local_pool=None):
+    """Main simulation loop for the master node. With `local_pool`, zones run in local processes instead of HTTP workers."""
+    global simulation_step, simulation_active, simulation_start_time, step_start_time, step_time_sum, async_fanout
 
     print("Master: Starting simulation loop...")
-    simulation_start_time = time.time()
+    threading.Thread(target=sse_emitter_loop, daemon=True).start()
+    state_dirty.set() # Initial (empty) dashboard state for early SSE clients
+    if local_pool is not None:
+        local_pool.start()
+    elif aiohttp is not None:
+        async_fanout = AsyncStepFanout()
+    simulation_start_time = time.monotonic()
     end_time = simulation_start_time + duration if duration else float('inf')
 
     # Better worker waiting logic
     print("Master: Waiting for workers to register...")
     expected_zones = ['North', 'South', 'East', 'West']
     initial_wait_timeout = 30 # Give workers up to 30 seconds to register
-    start_wait_time = time.time()
-    
-    while len(registered_workers) < len(expected_zones):
-        if time.time() - start_wait_time > initial_wait_timeout:
-            print(f"Master: Timeout waiting for all workers. Got {len(registered_workers)}/{len(expected_zones)}. Starting with available workers.")
-            break
-        time.sleep(1) # Check every second for new registrations
+
+    # Registrations notify state_cv, so we start the moment the last worker arrives
+    with state_cv:
+        all_registered = state_cv.wait_for(lambda: len(registered_workers) >= len(expected_zones), timeout=initial_wait_timeout)
+    if not all_registered:
+        print(f"Master: Timeout waiting for all workers. Got {len(registered_workers)}/{len(expected_zones)}. Starting with available workers.")
     
     if not registered_workers:
         print("Master: No workers registered. Exiting simulation.")
@@ -671,43 +1265,40 @@ def master_simulation_loop(duration=None, test_mode=False):
 
     print(f"Master: Starting simulation with {len(registered_workers)} workers: {list(registered_workers.keys())}")
 
-    while simulation_active and time.time() < end_time:
+    step_start_time = time.monotonic()
+    while simulation_active and step_start_time < end_time:
         simulation_step += 1
-        step_start_time = time.time()
         # print(f"\nMaster: Simulation Step {simulation_step}") # Commented out for less console spam
 
         # Send step commands to all workers
-        for zone, worker_info in list(registered_workers.items()):
-            worker_url = worker_info['url']
-            try:
-                response = requests.post(
-                    f"{worker_url}/simulate_step",
-                    json={"step": simulation_step, "master_id": "master_123"},
-                    timeout=3 # Short timeout for worker response
-                )
-                response.raise_for_status()
-            except requests.exceptions.RequestException as e:
-                print(f"Master: Error communicating with worker {zone} at {worker_url}: {e}")
-                # Consider logic to mark worker as down or remove it
+        if local_pool is not None:
+            local_pool.step(simulation_step)
+        else:
+            # In parallel, so a step takes as long as the slowest worker rather than the sum of all of them
+            dispatch_step(simulation_step)
                 
-        # Calculate total cars and update graph data
-        current_total_cars = sum(data['car_count'] for data in registered_workers.values())
-        
-        with graph_data_lock:
-            graph_data_history.append((simulation_step, current_total_cars))
+        # The chart point for this step is recorded by apply_traffic_update once every zone has reported it
+        state_dirty.set() # The step counter advanced
 
-        step_end_time = time.time()
+        step_end_time = time.monotonic()
         step_duration = step_end_time - step_start_time
+        if len(step_times) == STEP_TIMES_WINDOW:
+            step_time_sum -= step_times[0] # About to be evicted by the append
         step_times.append(step_duration)
+        step_time_sum += step_duration
 
-        # print(f"Master: Step {simulation_step} completed. Total cars: {current_total_cars}") # Commented out for less console spam
+        # print(f"Master: Step {simulation_step} completed. Total cars: {total_cars}") # Commented out for less console spam
         time.sleep(0.5) # Master orchestrates steps every 0.5 seconds
+        step_start_time = time.monotonic() # One clock read per tick, shared by the loop check and step timing
 
     simulation_active = False
+    if local_pool is not None:
+        local_pool.close()
+    state_dirty.set()
     print("Master: Simulation loop finished.")
 
     if test_mode and step_times:
-        avg_step_time = statistics.mean(step_times)
+        avg_step_time = step_time_sum / len(step_times)
         print(f"Performance Metrics: avg_step_time: {avg_step_time:.4f}")
     elif test_mode:
         print("Performance Metrics: No step times recorded for test mode.")
@@ -715,109 +1306,183 @@ def master_simulation_loop(duration=None, test_mode=False):
 # =============================================================================
 # Worker Node Logic
 # =============================================================================
-worker_vehicles = []
 worker_traffic_light = None
-current_zone_bounds = (0, 0, ZONE_SIZE, ZONE_SIZE) # Fixed bounds for worker visualization
-
-@app.route('/simulate_step', methods=['POST'])
-def worker_simulate_step():
-    """Endpoint for the master to tell a worker to perform a simulation step."""
-    global simulation_step, worker_vehicles, worker_traffic_light
-    
-    data = request.json
-    master_step = data.get('step')
-    
-    simulation_step = master_step
+worker_vehicles = ZoneState()
 
+def advance_zone(vehicles, traffic_light, now):
+    """One tick of zone physics, shared by HTTP workers and local zone processes."""
     # Update traffic light
-    if worker_traffic_light:
-        worker_traffic_light.update()
+    if traffic_light:
+        traffic_light.update(now)
 
     # Move vehicles
-    for vehicle in worker_vehicles:
-        vehicle.move()
-
-    # Better vehicle management: Add vehicles with higher probability, remove occasionally
-    if random.random() < 0.4 and len(worker_vehicles) < MAX_CARS_PER_ZONE:
-        direction = random.choice(['E', 'W', 'N', 'S'])
-        # Spawn points slightly outside the edge to make full "enter" visible
-        if direction == 'E': x,y = -CAR_SIZE, ZONE_SIZE/2 - CAR_SIZE/2
-        elif direction == 'W': x,y = ZONE_SIZE, ZONE_SIZE/2 - CAR_SIZE/2
-        elif direction == 'S': x,y = ZONE_SIZE/2 - CAR_SIZE/2, -CAR_SIZE
-        elif direction == 'N': x,y = ZONE_SIZE/2 - CAR_SIZE/2, ZONE_SIZE
-        else: x,y = random.randint(0, ZONE_SIZE - CAR_SIZE), random.randint(0, ZONE_SIZE - CAR_SIZE) # Fallback random
-        
-        new_car_id = f"{worker_id}_car_{simulation_step}_{random.randint(0,1000)}"
-        worker_vehicles.append(Vehicle(x, y, direction, current_zone_bounds, new_car_id))
-
+    vehicles.step()
+
+    # Better vehicle management: Add vehicles with higher probability, remove occasionally.
+    # One draw decides both: [0, 0.4) adds a car, [0.4, 0.42) removes one.
+    r = random.random()
+    n = len(vehicles)
+    if r < 0.4:
+        if n < MAX_CARS_PER_ZONE:
+            direction = next_direction()
+            x, y = SPAWN_XY[direction]
+            vehicles.add(x, y, direction)
     # Remove vehicles occasionally to prevent infinite growth / simulate exiting
-    if random.random() < 0.02 and len(worker_vehicles) > 20: # Decreased removal probability, increased min cars (WAS 0.05, 10)
+    elif r < 0.42 and n > 20: # Decreased removal probability, increased min cars (WAS 0.05, 10)
         # Only remove if there are enough cars to maintain some traffic
-        worker_vehicles.pop(random.randint(0, len(worker_vehicles) - 1))
+        vehicles.remove(int((r - 0.4) * 50 * n)) # r is uniform within [0.4, 0.42), so this index is too
 
-    # Get states for master
-    vehicles_state = [v.get_state() for v in worker_vehicles]
-    traffic_light_state = worker_traffic_light.get_state() if worker_traffic_light else None
+def seed_zone(vehicles):
+    """Place the initial cars of a zone on its roads."""
+    # Better initial vehicle setup: more cars, distributed on roads
+    initial_car_count = random.randint(20, 35) # More initial cars (WAS 15-25)
+    # Whole batch drawn and placed with NumPy, no per-car branching
+    dirs = rng.integers(0, len(DIRECTIONS), size=initial_car_count)
+    u = rng.random(initial_car_count)
+    # E/S cars start on the first 40% of their road, W/N cars on the last 40%
+    along = np.where((dirs == DIRECTION_CODES['E']) | (dirs == DIRECTION_CODES['S']), u * (ZONE_SIZE * 0.4), ZONE_SIZE * (0.6 + 0.4 * u))
+    horizontal = dirs < 2 # E and W drive along the horizontal road
+    lane = ZONE_SIZE/2 - CAR_SIZE/2
+    vehicles.extend(np.where(horizontal, along, lane), np.where(horizontal, lane, along), dirs)
 
-    # Send update to master
-    try:
-        response = requests.post(
-            f"http://{master_host}:{master_port}/traffic_update",
-            json={
-                "zone": worker_zone,
-                "car_count": len(worker_vehicles), # Report current count of vehicles in this zone
-                "worker_id": worker_id,
-                "vehicles": vehicles_state,       # Include detailed vehicle states
-                "traffic_light": traffic_light_state # Include traffic light state
-            },
+@app.route('/simulate_step', methods=['POST'])
+def worker_simulate_step():
+    """Endpoint for the master to tell a worker to perform a simulation step."""
+    global simulation_step, last_simulated_step
+    
+    data = json_loads(request.get_data()) # Hot path: orjson when available instead of Flask's stdlib json
+    master_step = data.get('step')
+    
+    with worker_step_lock:
+        if master_step != last_simulated_step:
+            simulation_step = last_simulated_step = master_step
+            simulate_step(time.monotonic())
+    return Response(SIMSTEP_ACK_BODY, mimetype='application/json')
+
+def simulate_step(now):
+    """Advance this worker's zone by one tick; `now` is the tick's single monotonic clock read."""
+    advance_zone(worker_vehicles, worker_traffic_light, now)
+
+    # Buffer this step; the master only hears from us every `update_batch_ticks` steps
+    pending_updates.append((simulation_step, len(worker_vehicles)))
+    if len(pending_updates) >= update_batch_ticks:
+        batch = [{"step": step, "car_count": car_count} for step, car_count in pending_updates]
+        pending_updates.clear()
+        # Older steps are superseded on the master, so only the newest carries the zone state
+        batch[-1]["vehicles_b64"] = worker_vehicles.pack() # Packed here so the master just forwards it
+        batch[-1]["traffic_light"] = worker_traffic_light.get_state() if worker_traffic_light else None
+        schedule_update_to_master(batch)
+
+def schedule_update_to_master(batch):
+    """Queue a batch for delivery once its simulated network latency has passed."""
+    global last_outbound_due
+    with outbound_cv:
+        # Never schedule before the previous message: updates arrive in order, like over one TCP link
+        due = max(time.monotonic() + net_sim.sample_delay(), last_outbound_due)
+        last_outbound_due = due
+        if len(outbound_queue) == MAX_OUTBOUND_BATCHES:
+            print(f"Worker {worker_id}: Master is falling behind, dropping the oldest queued update")
+        outbound_queue.append((due, batch)) # Evicts the oldest entry when full
+        outbound_cv.notify()
+
+def outbound_sender_loop():
+    """Background thread delivering queued batches to the master as they fall due."""
+    while True:
+        with outbound_cv:
+            while not outbound_queue:
+                outbound_cv.wait()
+            due, batch = outbound_queue[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                outbound_cv.wait(delay)
+                continue
+            outbound_queue.popleft()
+
+            # Coalesce whatever else falls due within the batch window into the same POST. Adaptive:
+            # if a backlog was already waiting, it is sent at once; the window is only waited out
+            # when the queue was quiet, to give the next few steps a chance to share the request.
+            batch = list(batch)
+            now = time.monotonic()
+            backlog = bool(outbound_queue) and outbound_queue[0][0] <= now
+            window_end = now if backlog else now + batch_window_ms / 1000.0
+            while len(batch) < MAX_BATCH_UPDATES:
+                now = time.monotonic()
+                if outbound_queue and outbound_queue[0][0] <= now:
+                    if len(batch) + len(outbound_queue[0][1]) > MAX_BATCH_UPDATES:
+                        break # Would overshoot the cap: leave it for the next POST
+                    batch.extend(outbound_queue.popleft()[1])
+                    continue
+                wait = window_end - now
+                if outbound_queue:
+                    wait = min(wait, outbound_queue[0][0] - now)
+                if window_end <= now:
+                    break
+                outbound_cv.wait(wait)
+        send_updates_to_master(batch)
+
+def send_updates_to_master(batch):
+    """POST a batch of buffered step snapshots to the master."""
+    global last_sent_traffic_light, use_msgpack_updates
+    # Coalesced batches hold several full snapshots, but the master only applies the newest one
+    latest = dict(batch[-1])
+    batch = [{"step": update["step"], "car_count": update["car_count"]} for update in batch[:-1]]
+    traffic_light = latest.get("traffic_light")
+    if traffic_light is not None and traffic_light == last_sent_traffic_light:
+        del latest["traffic_light"] # The master keeps the last light it got; it flips only every few seconds
+    batch.append(latest)
+    update = {
+        "zone": worker_zone,
+        "worker_id": worker_id,
+        "batch": batch # [{step, car_count}, ..., {step, car_count, vehicles_b64[, traffic_light]}]
+    }
+
+    def post_update():
+        body, content_type = encode_update(update)
+        return http_session.post(
+            f"http://{master_host}:{master_port}/traffic_update_batch",
+            data=body,
+            headers={'Content-Type': content_type},
             timeout=5
         )
+
+    try:
+        response = post_update()
+        if response.status_code == 415 and use_msgpack_updates:
+            # The master cannot read msgpack after all: use JSON from now on and resend this batch
+            print(f"Worker {worker_id}: Master rejected msgpack, falling back to JSON")
+            use_msgpack_updates = False
+            response = post_update()
         response.raise_for_status()
-        print(f"Worker {worker_id}: Sent update to master. Status: {response.status_code}")
+        last_sent_traffic_light = traffic_light # Only once delivered; after a failure the next POST re-sends it
+        print(f"Worker {worker_id}: Sent {len(batch)} update(s) to master. Status: {response.status_code}")
     except requests.exceptions.RequestException as e:
         print(f"Worker {worker_id}: Error sending update to master: {e}")
 
-    return jsonify({"status": "acknowledged", "worker_id": worker_id})
-
 def worker_startup(zone, host, port=5000):
     """Initialize and register the worker with the master."""
-    global worker_zone, master_host, master_port, worker_traffic_light, worker_vehicles
+    global worker_zone, master_host, master_port, worker_traffic_light, worker_vehicles, simulation_step, use_msgpack_updates
     worker_zone = zone
     master_host = host
     master_port = port
     
-    # Better initial vehicle setup: more cars, distributed on roads
-    initial_car_count = random.randint(20, 35) # More initial cars (WAS 15-25)
-    for i in range(initial_car_count):
-        direction = random.choice(['E', 'W', 'N', 'S'])
-        x, y = 0, 0 # Initialize, will be set based on direction
-        # Initial placement to distribute cars on roads
-        if direction == 'E': x,y = random.uniform(0, ZONE_SIZE * 0.4), ZONE_SIZE/2 - CAR_SIZE/2
-        elif direction == 'W': x,y = random.uniform(ZONE_SIZE * 0.6, ZONE_SIZE), ZONE_SIZE/2 - CAR_SIZE/2
-        elif direction == 'S': x,y = ZONE_SIZE/2 - CAR_SIZE/2, random.uniform(0, ZONE_SIZE * 0.4)
-        elif direction == 'N': x,y = ZONE_SIZE/2 - CAR_SIZE/2, random.uniform(ZONE_SIZE * 0.6, ZONE_SIZE)
-        
-        worker_vehicles.append(Vehicle(x, y, direction, current_zone_bounds, f"car_{zone}_{i}"))
-    
+    seed_zone(worker_vehicles)
+    worker_vehicles.warm_up()
+
     # Create traffic light for this zone
     worker_traffic_light = TrafficLight(ZONE_SIZE/2, ZONE_SIZE/2)
 
-    # Find available port for worker's Flask server
+    # Let the kernel pick a free port for the worker's Flask server (bind to port 0 and read it back).
+    # The socket stays open and is handed to the server, so nothing can grab the port in between, and
+    # it listens right away: a step sent just after registration waits in the backlog instead of failing.
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    base_port = master_port + 100 # Workers use ports starting from master_port + 100
-    worker_self_port = None
-    
-    for p in range(base_port, base_port + 200): # Search for an available port in a range
-        try:
-            s.bind(("0.0.0.0", p))
-            s.close()
-            worker_self_port = p
-            break
-        except OSError:
-            continue
-    
-    if worker_self_port is None:
-        print("Worker: Could not find available port to bind its Flask server. Exiting.")
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        s.bind(("0.0.0.0", 0))
+        s.listen(128)
+        worker_self_port = s.getsockname()[1]
+    except OSError as e:
+        s.close()
+        print(f"Worker: Could not find available port to bind its Flask server ({e}). Exiting.")
         sys.exit(1)
 
     # Use localhost for worker's self URL to ensure correct registration on the same machine
@@ -828,9 +1493,9 @@ def worker_startup(zone, host, port=5000):
     retries = 10 # More retries for robustness
     
     print(f"Worker {worker_id} ({worker_zone}): Attempting to register with master at {master_url}...")
-    while retries > 0:
+    for attempt in range(retries):
         try:
-            response = requests.post(
+            response = http_session.post(
                 f"{master_url}/register_worker",
                 json={
                     "zone": worker_zone,
@@ -840,23 +1505,33 @@ def worker_startup(zone, host, port=5000):
                 timeout=5
             )
             response.raise_for_status()
+            reply = response.json()
+            simulation_step = reply.get('step', 0) # Older masters only acknowledge
+            use_msgpack_updates = msgpack is not None and 'msgpack' in reply.get('update_formats', ())
             print(f"Worker {worker_id} ({worker_zone}): Registered successfully with master! My URL: {worker_self_url}")
             break
         except requests.exceptions.ConnectionError:
-            print(f"Worker {worker_id}: Master not reachable at {master_url}. Retrying ({retries} left)...")
-            time.sleep(2)
-            retries -= 1
+            print(f"Worker {worker_id}: Master not reachable at {master_url}. Retrying ({retries - attempt - 1} left)...")
         except requests.exceptions.RequestException as e:
             print(f"Worker {worker_id}: Registration error: {e}")
-            retries -= 1
-            time.sleep(2)
+        # Exponential backoff: retry quickly while the master is starting, back off to 5 s if it stays down
+        time.sleep(min(0.2 * 2 ** attempt, 5.0))
     else:
         print(f"Worker {worker_id}: Failed to register with master after multiple retries. Exiting.")
         sys.exit(1)
 
+    threading.Thread(target=outbound_sender_loop, daemon=True).start()
+    # Report the seeded zone now, so the dashboard shows it before the master's next step reaches us
+    schedule_update_to_master([{
+        "step": simulation_step,
+        "car_count": len(worker_vehicles),
+        "vehicles_b64": worker_vehicles.pack(),
+        "traffic_light": worker_traffic_light.get_state()
+    }])
+
     # Start worker's Flask server in a daemon thread
     print(f"Worker {worker_id} ({worker_zone}): Starting Flask server on {worker_self_url.split('//')[1]}")
-    threading.Thread(target=lambda: app.run(host='0.0.0.0', port=worker_self_port, debug=False, use_reloader=False), daemon=True).start()
+    threading.Thread(target=run_server, args=(worker_self_port, 4, s), daemon=True).start() # The master steps workers one call at a time
 
     print(f"Worker {worker_id} ({worker_zone}): Worker ready and listening on port {worker_self_port}. Waiting for master commands.")
     
@@ -867,6 +1542,87 @@ def worker_startup(zone, host, port=5000):
     except KeyboardInterrupt:
         print(f"Worker {worker_id} ({worker_zone}): Shutting down...")
 
+# =============================================================================
+# Local Mode (all zones on this host, no worker HTTP)
+# =============================================================================
+def local_zone_process(zone, shm_name, commands, results):
+    """Zone process for local mode: steps on command and leaves its cars in shared memory."""
+    reset_rng()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    vehicles = ZoneState(buffer=shm.buf)
+    seed_zone(vehicles)
+    vehicles.warm_up()
+    traffic_light = TrafficLight(ZONE_SIZE/2, ZONE_SIZE/2)
+    results.put((zone, 0, len(vehicles), traffic_light.get_state())) # Ready
+
+    while True:
+        step = commands.get()
+        if step is None:
+            break
+        advance_zone(vehicles, traffic_light, time.monotonic())
+        # The master reads the arrays only between our reply and its next command
+        results.put((zone, step, len(vehicles), traffic_light.get_state()))
+
+    vehicles = None # Views into shm.buf must be gone before it can close
+    shm.close()
+
+class LocalZonePool:
+    """One process per zone, driven over queues, with vehicle arrays in shared memory."""
+    def __init__(self, zones):
+        self.zones = zones
+        self.results = multiprocessing.Queue()
+        self.commands = {}
+        self.processes = {}
+        self.shms = {}
+        self.views = {}
+
+    def start(self):
+        for zone in self.zones:
+            shm = shared_memory.SharedMemory(create=True, size=ZoneState.buffer_size())
+            commands = multiprocessing.Queue()
+            process = multiprocessing.Process(target=local_zone_process, args=(zone, shm.name, commands, self.results), daemon=True)
+            process.start()
+            self.shms[zone] = shm
+            self.commands[zone] = commands
+            self.processes[zone] = process
+            self.views[zone] = ZoneState(buffer=shm.buf)
+            add_registered_worker(zone, f"local://pid-{process.pid}", f"local_{zone}")
+        self.collect(0)
+
+    def step(self, step):
+        """Advance every zone one tick in parallel and apply the results to the master state."""
+        for zone in self.zones:
+            self.commands[zone].put(step)
+        self.collect(step)
+
+    def collect(self, step):
+        """Apply each zone's reply to `step`; zones that miss the deadline are skipped for this step."""
+        waiting = set(self.zones)
+        deadline = time.monotonic() + 3
+        while waiting:
+            try:
+                zone, zone_step, car_count, traffic_light = self.results.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                print(f"Master: Timed out waiting for local zones {sorted(waiting)} at step {step}")
+                return
+            if zone_step != step or zone not in waiting:
+                continue # Late reply to a step we already gave up on; that zone may be writing shared memory again
+            waiting.discard(zone)
+            view = self.views[zone]
+            view.count = car_count
+            # Packing copies out of shared memory before the zone overwrites it next tick
+            apply_traffic_update(zone, f"local_{zone}", car_count, view.pack(), traffic_light, zone_step)
+
+    def close(self):
+        for zone in self.zones:
+            self.commands[zone].put(None)
+        for zone in self.zones:
+            self.processes[zone].join(timeout=5)
+        self.views.clear()
+        for shm in self.shms.values():
+            shm.close()
+            shm.unlink()
+
 # =============================================================================
 # Main Entry Point
 # =============================================================================
@@ -880,6 +1636,9 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=5000, help="Port for the master node's API")
     parser.add_argument("--test-mode", action="store_true", help="Run master in test mode (for performance_test.py)")
     parser.add_argument("--duration", type=int, default=60, help="Duration of simulation in seconds (for master, especially in test mode)")
+    parser.add_argument("--local", action="store_true", help="Run all zones as local processes on the master host instead of HTTP workers (with --master)")
+    parser.add_argument("--batch-window-ms", type=int, default=0, help="Milliseconds a worker waits to coalesce queued updates into one POST; useful with fast steps (for workers)")
+    parser.add_argument("--batch-ticks", type=int, default=1, help="Simulation steps buffered into one update to the master (for workers)")
 
     args = parser.parse_args()
 
@@ -890,13 +1649,16 @@ if __name__ == "__main__":
 
     if args.master:
         print(f"Starting Distributed Traffic Simulation Master on port {args.port}...")
-        simulation_thread = threading.Thread(target=master_simulation_loop, args=(args.duration, args.test_mode), daemon=True)
+        local_pool = LocalZonePool(['North', 'South', 'East', 'West']) if args.local else None
+        simulation_thread = threading.Thread(target=master_simulation_loop, args=(args.duration, args.test_mode, local_pool), daemon=True)
         simulation_thread.start()
         
-        app.run(host='0.0.0.0', port=args.port, debug=False, use_reloader=False)
+        run_server(args.port)
 
     elif args.worker:
         if not args.zone:
             parser.error("Worker mode requires --zone argument.")
         print(f"Starting Distributed Traffic Simulation Worker for zone {args.zone}...")
+        update_batch_ticks = max(1, args.batch_ticks)
+        batch_window_ms = max(0, args.batch_window_ms)
         worker_startup(args.zone, args.host, args.port)